@@ -0,0 +1,664 @@
+"""
+Shared departure board code: Huxley fetching, service classification and
+RGB matrix rendering. Each board script only configures a station and
+calls main().
+"""
+import os
+import selectors
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    from orjson import loads as json_loads  # C parser, much faster on a Pi
+except ImportError:
+    from json import loads as json_loads
+
+import requests
+from requests.adapters import HTTPAdapter
+from rgbmatrix import RGBMatrix, RGBMatrixOptions, graphics
+
+try:
+    # Optional: pre-rasterise scrolling text once and blit it with SetImage
+    from PIL import Image
+    from PIL.BdfFontFile import bdf_char
+except ImportError:
+    Image = None
+
+# =========================
+# CONFIG
+# =========================
+
+STATION_CODE = "NTN"                # Default station; override via main(station=...)
+NUM_TRAINS_TO_SHOW = 2
+
+API_HOST = "huxley2.azurewebsites.net"
+DNS_TTL = 300                       # Seconds to reuse the resolved API address
+
+DISPLAY_SECONDS_PER_TRAIN = 5       # How long to show each train (if no scroll)
+DEST_MAX_CHARS = 32                 # Safety cap before trimming destination text
+FETCH_INTERVAL = 20                 # Seconds between background polls
+# Minimum seconds to reuse a fetched board. The fetcher already waits this
+# long between polls, so the cache only skips a request when the server's
+# Cache-Control max-age asks for longer (see cache_ttl).
+CACHE_TTL = FETCH_INTERVAL
+RETRY_INTERVAL = 5                  # Seconds before retrying a failed poll
+STALE_LIMIT = 120                   # Keep showing the last good board this long on errors
+
+# Scrolling behaviour
+SCROLL_FRAME_DELAY = 0.05           # Seconds between scroll steps
+SCROLL_START_X = 64                 # Start just off the right edge
+
+# Clock position (top-right area)
+CLOCK_X = 12
+CLOCK_Y = 8
+
+# RGBMatrix options
+options = RGBMatrixOptions()
+options.rows = 32
+options.cols = 64
+options.chain_length = 1
+options.parallel = 1
+options.hardware_mapping = "adafruit-hat"
+options.brightness = 60
+options.gpio_slowdown = 4
+
+# Font paths (relative to script working directory)
+FONT_PATH_MAIN = "fonts/4x6.bdf"   # Train text
+FONT_PATH_CLOCK = "fonts/5x8.bdf"  # Clock text
+
+# Colours (built once; graphics.Color crosses into C on every construction).
+# Every colour comes from this fixed palette.
+PALETTE = {
+    "green": graphics.Color(0, 255, 0),
+    "amber": graphics.Color(255, 165, 0),
+    "red": graphics.Color(255, 0, 0),
+    "white": graphics.Color(255, 255, 255),
+    "black": graphics.Color(0, 0, 0),
+}
+CLOCK_COLOR = PALETTE["white"]
+
+# classify_service status -> colour
+STATUS_COLORS = {
+    "on_time": PALETTE["green"],
+    "delayed": PALETTE["amber"],
+    "cancelled": PALETTE["red"],
+    "unknown": PALETTE["white"],
+}
+
+
+# =========================
+# DATA & TEXT HELPERS
+# =========================
+
+class PinnedDNSAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that connects to a cached IP for one host instead of doing a
+    DNS lookup per request. TLS SNI, certificate checks and the Host header
+    still use the real hostname. The address is re-resolved every DNS_TTL
+    seconds, or on the next request after a connection error.
+    """
+
+    def __init__(self, host: str, **kwargs):
+        self.host = host
+        self._ip = None
+        self._resolved_at = float("-inf")
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["server_hostname"] = self.host
+        kwargs["assert_hostname"] = self.host
+        super().init_poolmanager(*args, **kwargs)
+
+    def resolve(self):
+        """Return the cached IP for the host, refreshing it when stale."""
+        if time.monotonic() - self._resolved_at > DNS_TTL:
+            try:
+                self._ip = socket.gethostbyname(self.host)
+                self._resolved_at = time.monotonic()
+            except OSError as exc:
+                # Keep the last known address; retry on the next request
+                print("ERROR resolving", self.host, exc)
+        return self._ip
+
+    def send(self, request, **kwargs):
+        url = request.url
+        parts = urlsplit(url)
+        ip = self.resolve()
+        set_host = ip is not None and "Host" not in request.headers
+        if ip is not None:
+            netloc = ip if parts.port is None else f"{ip}:{parts.port}"
+            request.url = urlunsplit(parts._replace(netloc=netloc))
+        if set_host:
+            request.headers["Host"] = parts.netloc
+        try:
+            response = super().send(request, **kwargs)
+        except requests.ConnectionError:
+            self._resolved_at = float("-inf")
+            raise
+        finally:
+            # Leave the caller's request as it was, so e.g. a redirect built
+            # from it doesn't carry our Host header to another host
+            request.url = url
+            if set_host:
+                del request.headers["Host"]
+        response.url = url
+        return response
+
+
+# One keep-alive connection to Huxley, reused across polls so each fetch
+# skips the TCP + TLS handshake (and, via PinnedDNSAdapter, the DNS lookup).
+SESSION = requests.Session()
+SESSION.headers["Accept-Encoding"] = "gzip"
+SESSION.mount(
+    f"https://{API_HOST}/",
+    PinnedDNSAdapter(API_HOST, pool_connections=1, pool_maxsize=2),
+)
+
+
+# Last good board per station: station code -> {"fetched", "expires",
+# "services", "etag", "last_modified"}. It honours a server max-age, backs
+# the stale-board fallback on errors (recent_services), and its validators
+# let an expired entry be revalidated with a conditional GET instead of
+# re-downloading the board.
+_cache = {}
+
+
+def cache_ttl(response) -> int:
+    """
+    Seconds to keep a response: the server's Cache-Control max-age if it asks
+    for longer than CACHE_TTL, otherwise CACHE_TTL.
+    """
+    for directive in response.headers.get("Cache-Control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.isdigit():
+            return max(CACHE_TTL, int(value))
+    return CACHE_TTL
+
+
+def api_url(station: str) -> str:
+    """
+    Huxley departures URL for a station. Only ask for the rows we display;
+    the payload (and parse time) scales with the row count.
+    """
+    return f"https://{API_HOST}/departures/{station}/{NUM_TRAINS_TO_SHOW}"
+
+
+def fetch_services(station: str = STATION_CODE):
+    """Fetch departure board data from Huxley2 API, reusing a recent result."""
+    cached = _cache.get(station)
+    if cached and time.monotonic() < cached["expires"]:
+        return cached["services"]
+
+    headers = {}
+    if cached and cached["etag"]:
+        headers["If-None-Match"] = cached["etag"]
+    if cached and cached["last_modified"]:
+        headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        response = SESSION.get(api_url(station), headers=headers, timeout=5)
+        if response.status_code == 304:
+            # Unchanged since the last poll: no body, keep the board we have
+            services = cached["services"]
+        else:
+            response.raise_for_status()
+            data = json_loads(response.content)
+            services = data.get("trainServices") or []
+    except Exception as exc:
+        print("ERROR fetching services:", exc)
+        return None
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if response.status_code == 304:
+        # A 304 may omit validators; keep the ones we already had
+        etag = etag or cached["etag"]
+        last_modified = last_modified or cached["last_modified"]
+
+    now = time.monotonic()
+    _cache[station] = {
+        "fetched": now,
+        "expires": now + cache_ttl(response),
+        "services": services,
+        "etag": etag,
+        "last_modified": last_modified,
+    }
+    return services
+
+
+def recent_services(station: str = STATION_CODE):
+    """Last good board for a station if fetched within STALE_LIMIT seconds, else None."""
+    cached = _cache.get(station)
+    if cached and time.monotonic() - cached["fetched"] < STALE_LIMIT:
+        return cached["services"]
+    return None
+
+
+def fetch_loop(state, lock, station: str = STATION_CODE, failed: bool = False):
+    """
+    Background fetcher: poll Huxley every FETCH_INTERVAL seconds (or
+    RETRY_INTERVAL after a failed poll), publish the latest services into
+    state["services"] under lock, and wake the render loop in case it is
+    waiting for a board. A failed poll republishes the last good board while
+    it is recent, so one transient error doesn't blank the display.
+    """
+    while True:
+        time.sleep(RETRY_INTERVAL if failed else FETCH_INTERVAL)
+        services = fetch_services(station)
+        failed = services is None
+        if failed:
+            services = recent_services(station)
+        with lock:
+            state["services"] = services
+        wake_render_loop()
+
+
+def trim_dest(name: str) -> str:
+    """Trim destination name to a safe maximum length."""
+    if len(name) <= DEST_MAX_CHARS:
+        return name
+    return name[: DEST_MAX_CHARS - 1] + "…"
+
+
+# Shared, immutable fallback so a missing destination doesn't allocate
+_NO_DESTINATION = ({},)
+
+
+def destination_name(svc) -> str:
+    """Name of a service's first destination, or "Unknown" if it has none."""
+    destinations = svc.get("destination") or _NO_DESTINATION
+    return destinations[0].get("locationName", "Unknown")
+
+
+# status -> (top line, bottom line) templates used by classify_service
+LINE_TEMPLATES = {
+    "cancelled": ("{std} {dest}", "P{plat} CANCELLED"),
+    "unknown": ("{std} {dest}", "P{plat} Check ETD"),
+    "on_time": ("{std} {dest}", "P{plat} On time"),
+    "delayed": ("{std}->{etd} {dest}", "P{plat} Delayed"),
+}
+
+
+def classify_service(svc):
+    """
+    Convert a raw service dict into two display lines and a status flag.
+
+    Returns:
+        (line1, line2, status)
+        status ∈ {"on_time", "delayed", "cancelled", "unknown"}
+    """
+    std = svc.get("std", "??:??")
+    etd = svc.get("etd", "")
+    dest = trim_dest(destination_name(svc))
+    plat = svc.get("platform") or "?"
+
+    cancelled = svc.get("isCancelled", False)
+
+    status = (
+        "cancelled" if cancelled
+        else "unknown" if not etd
+        else "on_time" if etd in ("On time", std)
+        else "delayed"
+    )
+    top_template, bottom_template = LINE_TEMPLATES[status]
+    top = top_template.format(std=std, etd=etd, dest=dest)
+    bottom = bottom_template.format(plat=plat)
+
+    return top, bottom, status
+
+
+# Measured text widths: (id(font), text) -> pixels. Fonts are loaded once
+# and live for the whole run, so entries never go stale, but line1 strings
+# (with their delay times) keep changing, so the oldest entries are dropped
+# once WIDTH_CACHE_SIZE is reached.
+WIDTH_CACHE_SIZE = 64
+_width_cache: dict[tuple[int, str], int] = {}
+
+
+def measure_text_width(canvas, font, color, text: str) -> int:
+    """
+    Measure the pixel width of a text string using the matrix font.
+    Each distinct (font, text) pair is only drawn once to measure it.
+    """
+    key = (id(font), text)
+    width = _width_cache.get(key)
+    if width is None:
+        canvas.Clear()
+        width = graphics.DrawText(canvas, font, 0, 0, color, text)
+        canvas.Clear()
+        if len(_width_cache) >= WIDTH_CACHE_SIZE:
+            del _width_cache[next(iter(_width_cache))]
+        _width_cache[key] = width
+    return width
+
+
+@dataclass(slots=True)
+class TrainLine:
+    """A train resolved once per fetch into exactly what the renderer draws."""
+    line1: str
+    line2: str
+    width: int              # Pixel width of line1 in the train font
+    color: graphics.Color
+    strip: object = None    # Pre-rendered line1 image when it has to scroll
+
+
+def load_glyphs(path: str):
+    """
+    Load a BDF font's glyphs for render_strip, keyed by character.
+    Returns None when Pillow isn't installed.
+    """
+    if Image is None:
+        return None
+    glyphs = {}
+    with open(path, "rb") as fp:
+        while True:
+            char = bdf_char(fp)
+            if char is None:
+                break
+            _, encoding, bbox, im = char
+            if encoding >= 0:
+                glyphs[chr(encoding)] = (bbox, im)
+    return glyphs
+
+
+def render_strip(glyphs, font, color, text: str, width: int):
+    """
+    Rasterise text once into an RGB image one font-height tall, so scrolling
+    only has to crop and blit it. Returns None if a glyph is missing.
+    """
+    strip = Image.new("RGB", (width, font.height))
+    fill = (color.red, color.green, color.blue)
+    x = 0
+    for ch in text:
+        glyph = glyphs.get(ch)
+        if glyph is None:
+            return None
+        ((advance, _), (x_off, y_off, _, _), _), im = glyph
+        if im.width and im.height:
+            strip.paste(fill, (x + x_off, font.baseline + y_off), im)
+        x += advance
+    return strip
+
+
+def build_train_lines(services, canvas, font, glyphs=None):
+    """Classify, colour and measure the services to show, once per fetch."""
+    trains = []
+    for svc in services[:NUM_TRAINS_TO_SHOW]:
+        line1, line2, status = classify_service(svc)
+        color = STATUS_COLORS[status]
+        width = measure_text_width(canvas, font, color, line1)
+        strip = None
+        if glyphs is not None and width > canvas.width:
+            strip = render_strip(glyphs, font, color, line1, width)
+        trains.append(TrainLine(line1, line2, width, color, strip))
+    return trains
+
+
+# =========================
+# DRAWING: CLOCK + TRAINS
+# =========================
+
+# The render loop waits in select() on a wake-up pipe rather than in
+# time.sleep(), so other threads (the fetcher) can cut a wait short.
+_selector = selectors.DefaultSelector()
+_wake_r, _wake_w = os.pipe()
+os.set_blocking(_wake_r, False)
+os.set_blocking(_wake_w, False)
+_selector.register(_wake_r, selectors.EVENT_READ)
+
+
+def wake_render_loop():
+    """Interrupt a sleep_until(..., wake=True) in the render loop."""
+    try:
+        os.write(_wake_w, b"\0")
+    except BlockingIOError:
+        pass  # A wake-up is already pending
+
+
+def sleep_until(deadline: float, wake: bool = False) -> bool:
+    """
+    Wait until a time.monotonic() deadline; return at once if it has passed.
+    With wake=True, return early (True) when wake_render_loop() is called.
+    """
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        if _selector.select(remaining):
+            try:
+                while os.read(_wake_r, 512):
+                    pass
+            except BlockingIOError:
+                pass
+            if wake:
+                return True
+
+
+def text_rows(font, baseline: int):
+    """Return the (top, bottom) pixel rows covered by a line of text."""
+    top = baseline - font.baseline
+    return top, top + font.height - 1
+
+
+def clear_rows(canvas, top: int, bottom: int):
+    """Blank rows top..bottom (inclusive) across the full panel width."""
+    for y in range(top, bottom + 1):
+        graphics.DrawLine(canvas, 0, y, canvas.width - 1, y, PALETTE["black"])
+
+
+# Last formatted clock: [epoch second, "HH:MM:SS"]
+_clock_text = [None, ""]
+
+
+def clock_text(sec: int) -> str:
+    """Local HH:MM:SS for an epoch second, formatted at most once per second."""
+    if _clock_text[0] != sec:
+        t = time.localtime(sec)
+        _clock_text[:] = sec, f"{t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}"
+    return _clock_text[1]
+
+
+def draw_clock(offscreen_canvas, clock_font, clock_color, sec=None):
+    """Draw current time in HH:MM:SS at fixed top-right position."""
+    if sec is None:
+        sec = int(time.time())
+    graphics.DrawText(offscreen_canvas, clock_font, CLOCK_X, CLOCK_Y,
+                      clock_color, clock_text(sec))
+
+
+def refresh_clock(offscreen_canvas, clock_font, clock_color, last_secs, frame: int):
+    """
+    Redraw the clock only when the second has changed since this buffer last
+    showed it. SwapOnVSync alternates between two buffers, so last_secs holds
+    the second last drawn into each, indexed by frame parity.
+    """
+    sec = int(time.time())
+    buf = frame % 2
+    if last_secs[buf] != sec:
+        clear_rows(offscreen_canvas, *text_rows(clock_font, CLOCK_Y))
+        draw_clock(offscreen_canvas, clock_font, clock_color, sec)
+        last_secs[buf] = sec
+
+
+def draw_background(matrix, offscreen_canvas, font, lines, clock_font, clock_color):
+    """
+    Paint the text that stays fixed for a whole train into both buffers of
+    the SwapOnVSync chain, so later frames only touch the rows that change.
+
+    lines is a sequence of (x, y, color, text) tuples.
+    """
+    for _ in range(2):
+        offscreen_canvas.Clear()
+        for x, y, color, text in lines:
+            graphics.DrawText(offscreen_canvas, font, x, y, color, text)
+        draw_clock(offscreen_canvas, clock_font, clock_color)
+        offscreen_canvas = matrix.SwapOnVSync(offscreen_canvas)
+    return offscreen_canvas
+
+
+def show_train_with_scroll(
+    matrix,
+    offscreen_canvas,
+    font,
+    train: TrainLine,
+    clock_font,
+    clock_color,
+):
+    """
+    Show a single train:
+    - If line1 fits within the panel width, show it statically for a few seconds,
+      refreshing the clock periodically so seconds tick.
+    - If too long, scroll line1 horizontally while keeping the bottom line static.
+    """
+    line1, line2, width, color = train.line1, train.line2, train.width, train.color
+    strip = train.strip
+    panel_width = matrix.width
+
+    # Y positions for 32px-high panel
+    y1 = 16   # top line baseline
+    y2 = 28   # bottom line baseline
+
+    # Second last drawn into each swap buffer, so the clock is redrawn at 1Hz
+    last_secs = [-1, -1]
+    frame = 0
+
+    # Static display case: both lines are fixed, only the clock ticks
+    if width <= panel_width:
+        offscreen_canvas = draw_background(
+            matrix,
+            offscreen_canvas,
+            font,
+            [(1, y1, color, line1), (1, y2, color, line2)],
+            clock_font,
+            clock_color,
+        )
+        next_frame = time.monotonic()
+        deadline = next_frame + DISPLAY_SECONDS_PER_TRAIN
+
+        while time.monotonic() < deadline:
+            refresh_clock(offscreen_canvas, clock_font, clock_color, last_secs, frame)
+
+            offscreen_canvas = matrix.SwapOnVSync(offscreen_canvas)
+            frame += 1
+            next_frame += 0.25  # refresh clock ~4 times per second
+            sleep_until(next_frame)
+
+        return offscreen_canvas
+
+    # Scrolling case: line2 is fixed, so each frame only blanks and redraws
+    # the scrolling line (and the clock when the second ticks over). With a
+    # pre-rendered strip, each frame is one crop + SetImage of the line1 rows
+    # (the crop's out-of-range area is black, so it also blanks the band).
+    x = SCROLL_START_X
+    end_x = -width
+    line1_rows = text_rows(font, y1)
+
+    offscreen_canvas = draw_background(
+        matrix,
+        offscreen_canvas,
+        font,
+        [(1, y2, color, line2)],
+        clock_font,
+        clock_color,
+    )
+
+    # Pace against fixed deadlines rather than sleeping a constant after
+    # each swap, so draw-time jitter doesn't change the scroll speed.
+    next_frame = time.monotonic()
+
+    while x > end_x:
+        if strip is not None:
+            window = strip.crop((-x, 0, panel_width - x, strip.height))
+            offscreen_canvas.SetImage(window, 0, line1_rows[0])
+        else:
+            clear_rows(offscreen_canvas, *line1_rows)
+            graphics.DrawText(offscreen_canvas, font, x, y1, color, line1)
+
+        refresh_clock(offscreen_canvas, clock_font, clock_color, last_secs, frame)
+
+        offscreen_canvas = matrix.SwapOnVSync(offscreen_canvas)
+        frame += 1
+        x -= 1
+        next_frame += SCROLL_FRAME_DELAY
+        sleep_until(next_frame)
+
+    sleep_until(time.monotonic() + 0.5)
+    return offscreen_canvas
+
+
+# =========================
+# MAIN LOOP
+# =========================
+
+def main(station: str = STATION_CODE):
+    """Run the departure board for a station until Ctrl-C."""
+    matrix = RGBMatrix(options=options)
+
+    # Train text font
+    font = graphics.Font()
+    font.LoadFont(FONT_PATH_MAIN)
+
+    # Clock font
+    clock_font = graphics.Font()
+    clock_font.LoadFont(FONT_PATH_CLOCK)
+    glyphs = load_glyphs(FONT_PATH_MAIN)
+
+    offscreen_canvas = matrix.CreateFrameCanvas()
+    shown_services = None
+    trains = []
+
+    try:
+        # The fetcher thread owns the network; this thread only reads the
+        # latest board and drives the matrix, so HTTP stalls never freeze the
+        # panel. The first board has nothing to show yet, so fetch it up front.
+        services = fetch_services(station)
+        state = {"services": services}
+        lock = threading.Lock()
+        threading.Thread(
+            target=fetch_loop,
+            args=(state, lock, station, services is None),
+            daemon=True,
+        ).start()
+
+        while True:
+            with lock:
+                services = state["services"]
+
+            if services is None:
+                offscreen_canvas.Clear()
+                graphics.DrawText(offscreen_canvas, font, 1, 16, PALETTE["red"], "API ERROR")
+                graphics.DrawText(offscreen_canvas, font, 1, 28, PALETTE["red"], "Check network")
+                draw_clock(offscreen_canvas, clock_font, CLOCK_COLOR)
+                offscreen_canvas = matrix.SwapOnVSync(offscreen_canvas)
+                sleep_until(time.monotonic() + 5, wake=True)
+                continue
+
+            if not services:
+                offscreen_canvas.Clear()
+                graphics.DrawText(offscreen_canvas, font, 1, 16, PALETTE["amber"], "NO DATA")
+                graphics.DrawText(offscreen_canvas, font, 1, 28, PALETTE["amber"], "No trains")
+                draw_clock(offscreen_canvas, clock_font, CLOCK_COLOR)
+                offscreen_canvas = matrix.SwapOnVSync(offscreen_canvas)
+                sleep_until(time.monotonic() + 10, wake=True)
+                continue
+
+            # Only re-resolve the display lines when a new board arrives
+            if services is not shown_services:
+                trains = build_train_lines(services, offscreen_canvas, font, glyphs)
+                shown_services = services
+
+            for train in trains:
+                offscreen_canvas = show_train_with_scroll(
+                    matrix,
+                    offscreen_canvas,
+                    font,
+                    train,
+                    clock_font,
+                    CLOCK_COLOR,
+                )
+
+    except KeyboardInterrupt:
+        matrix.Clear()